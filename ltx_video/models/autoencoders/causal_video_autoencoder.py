@@ -984,7 +984,8 @@ class SpaceToDepthDownsample(nn.Module):
     def __init__(self, dims, in_channels, out_channels, stride, spatial_padding_mode):
         super().__init__()
         self.stride = stride
-        self.group_size = in_channels * np.prod(stride) // out_channels
+        # python ints rather than numpy scalars, which torch.compile traces as tensors and breaks the graph on
+        self.group_size = in_channels * int(np.prod(stride)) // out_channels
         self.conv = make_conv_nd(
             dims=dims,
             in_channels=in_channels,
@@ -1042,6 +1043,8 @@ class DepthToSpaceUpsample(nn.Module):
         self.out_channels = (
             np.prod(stride) * in_channels // out_channels_reduction_factor
         )
+        # a python int rather than a numpy scalar, which torch.compile traces as a tensor and breaks the graph on
+        self.num_repeat = int(np.prod(stride)) // out_channels_reduction_factor
         self.conv = make_conv_nd(
             dims=dims,
             in_channels=in_channels,
@@ -1059,8 +1062,7 @@ class DepthToSpaceUpsample(nn.Module):
         if self.residual:
             # Reshape and duplicate the input to match the output shape
             x_in = self.pixel_shuffle(x)
-            num_repeat = np.prod(self.stride) // self.out_channels_reduction_factor
-            x_in = x_in.repeat(1, num_repeat, 1, 1, 1)
+            x_in = x_in.repeat(1, self.num_repeat, 1, 1, 1)
             if self.stride[0] == 2:
                 x_in = x_in[:, :, 1:, :, :]
         x = self.conv(x, causal=causal)
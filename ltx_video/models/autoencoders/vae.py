@@ -1,6 +1,7 @@
-from typing import Optional, Union
+from typing import List, Optional, Union
 
 import torch
+import functools
 import inspect
 import math
 import torch.nn as nn
@@ -13,6 +14,82 @@ from diffusers.models.modeling_outputs import AutoencoderKLOutput
 from ltx_video.models.autoencoders.conv_nd_factory import make_conv_nd
 
 
+def _blend_z(a: torch.Tensor, b: torch.Tensor, blend_extent: int) -> torch.Tensor:
+    blend_extent = min(a.shape[2], b.shape[2], blend_extent)
+    if blend_extent <= 0:
+        return b
+    w = 1 - torch.arange(blend_extent, device=b.device, dtype=b.dtype) / blend_extent
+    w = w.view(1, 1, -1, 1, 1)
+    b[:, :, :blend_extent].lerp_(a[:, :, a.shape[2] - blend_extent:], w)
+    return b
+
+
+def _blend_v(a: torch.Tensor, b: torch.Tensor, blend_extent: int) -> torch.Tensor:
+    blend_extent = min(a.shape[3], b.shape[3], blend_extent)
+    if blend_extent <= 0:
+        return b
+    w = 1 - torch.arange(blend_extent, device=b.device, dtype=b.dtype) / blend_extent
+    w = w.view(1, 1, 1, -1, 1)
+    b[:, :, :, :blend_extent].lerp_(a[:, :, :, a.shape[3] - blend_extent:], w)
+    return b
+
+
+def _blend_h(a: torch.Tensor, b: torch.Tensor, blend_extent: int) -> torch.Tensor:
+    blend_extent = min(a.shape[4], b.shape[4], blend_extent)
+    if blend_extent <= 0:
+        return b
+    w = 1 - torch.arange(blend_extent, device=b.device, dtype=b.dtype) / blend_extent
+    w = w.view(1, 1, 1, 1, -1)
+    b[:, :, :, :, :blend_extent].lerp_(a[:, :, :, :, a.shape[4] - blend_extent:], w)
+    return b
+
+
+@functools.lru_cache(maxsize=None)
+def _scripted(fn):
+    return torch.jit.script(fn)
+
+
+def _blend_fn(fn):
+    # outside torch.compile the blend functions are scripted, so that the weight ramp and the lerp run as fused kernels.
+    # they are scripted on first use rather than at import, as recent torch releases deprecate torch.jit.script
+    if torch.compiler.is_compiling():
+        return fn
+    return _scripted(fn)
+
+
+def _stitch_tiles(rows: List[List[torch.Tensor]], blend_extent: int, row_limit: int) -> torch.Tensor:
+    # blend the above tile and the left tile into each tile and copy its kept
+    # part straight into a preallocated output instead of concatenating rows
+    heights = [min(row[0].shape[3], row_limit) for row in rows]
+    widths = [min(tile.shape[4], row_limit) for tile in rows[0]]
+    B, C, T = rows[0][0].shape[:3]
+    out = rows[0][0].new_empty((B, C, T, sum(heights), sum(widths)))
+    blend_v, blend_h = _blend_fn(_blend_v), _blend_fn(_blend_h)
+    h_off = 0
+    for i, row in enumerate(rows):
+        w_off = 0
+        for j, tile in enumerate(row):
+            # the cropped borders of a tile are only read back when blending the next row / column,
+            # so tiles of the last row / column are cropped before blending
+            tile = tile[
+                :,
+                :,
+                :,
+                : heights[i] if i == len(rows) - 1 else None,
+                : widths[j] if j == len(row) - 1 else None,
+            ]
+            if i > 0 and blend_extent > 0:
+                tile = blend_v(rows[i - 1][j][:, :, :, :, : tile.shape[4]], tile, blend_extent)
+            if j > 0 and blend_extent > 0:
+                tile = blend_h(row[j - 1][:, :, :, : tile.shape[3]], tile, blend_extent)
+            out[:, :, :, h_off : h_off + heights[i], w_off : w_off + widths[j]].copy_(
+                tile[:, :, :, : heights[i], : widths[j]]
+            )
+            w_off += widths[j]
+        h_off += heights[i]
+    return out
+
+
 class AutoencoderKLWrapper(ModelMixin, ConfigMixin):
     """Variational Autoencoder (VAE) model with KL loss.
 
@@ -51,10 +128,7 @@ class AutoencoderKLWrapper(ModelMixin, ConfigMixin):
         # )
         
         self.register_buffer("std_of_means", std_of_means)
-        self.register_buffer(
-            "mean_of_means",
-                torch.zeros_like(std_of_means)
-        )
+        self.register_buffer("mean_of_means", torch.zeros(128, dtype=torch.bfloat16))
 
 
         # pass init params to Encoder
@@ -76,19 +150,29 @@ class AutoencoderKLWrapper(ModelMixin, ConfigMixin):
             self.quant_conv = nn.Identity()
             self.post_quant_conv = nn.Identity()
 
+        # the kind of latent (un)normalization is picked once here rather than checked with isinstance on every call
         if normalize_latent_channels:
             if dims == 2:
                 self.latent_norm_out = nn.BatchNorm2d(latent_channels, affine=False)
+                self._latent_norm_kind = "bn2d"
             else:
                 self.latent_norm_out = nn.BatchNorm3d(latent_channels, affine=False)
+                self._latent_norm_kind = "bn3d"
         else:
             self.latent_norm_out = nn.Identity()
+            self._latent_norm_kind = None
         self.use_z_tiling = False
         self.use_hw_tiling = False
+        self.hw_tile_batch = 1
+        self.z_tile_batch = 1
+        self.compile_mode = None
+        # checkpoint each whole encoder / decoder call when training, so the activations of a tile are not kept
+        self.use_checkpoint = False
         self.dims = dims
         self.z_sample_size = 1
 
         self.decoder_params = inspect.signature(self.decoder.forward).parameters
+        self._decoder_takes_timestep = "timestep" in self.decoder_params
 
         # only relevant if vae tiling is enabled
         self.set_tiling_params(sample_size=sample_size, overlap_factor=0.25)
@@ -126,15 +210,17 @@ class AutoencoderKLWrapper(ModelMixin, ConfigMixin):
         self.tile_latent_min_size = int(sample_size / 32)
         self.tile_overlap_factor = overlap_factor
 
-    def enable_z_tiling(self, z_sample_size: int = 4):
+    def enable_z_tiling(self, z_sample_size: int = 4, z_tile_batch: int = 1):
         r"""
         Enable tiling during VAE decoding.
 
         When this option is enabled, the VAE will split the input tensor in tiles to compute decoding in several
-        steps. This is useful to save some memory and allow larger batch sizes.
+        steps. This is useful to save some memory and allow larger batch sizes. `z_tile_batch` consecutive tiles of
+        the same shape are stacked along the batch dimension and decoded in a single call.
         """
         self.use_z_tiling = z_sample_size > 1
         self.z_sample_size = z_sample_size
+        self.z_tile_batch = z_tile_batch
         assert (
             z_sample_size % 4 == 0 or z_sample_size == 1
         ), f"z_sample_size must be a multiple of 4 or 1. Got {z_sample_size}."
@@ -146,11 +232,15 @@ class AutoencoderKLWrapper(ModelMixin, ConfigMixin):
         """
         self.use_z_tiling = False
 
-    def enable_hw_tiling(self):
+    def enable_hw_tiling(self, hw_tile_batch: int = 1):
         r"""
         Enable tiling during VAE decoding along the height and width dimension.
+
+        `hw_tile_batch` tiles of the same shape are stacked along the batch dimension and encoded / decoded in a
+        single call. This keeps the GPU busy with small tiles at the cost of more memory per call.
         """
         self.use_hw_tiling = True
+        self.hw_tile_batch = hw_tile_batch
 
     def disable_hw_tiling(self):
         r"""
@@ -158,6 +248,77 @@ class AutoencoderKLWrapper(ModelMixin, ConfigMixin):
         """
         self.use_hw_tiling = False
 
+    def enable_compile(self, mode: str = "reduce-overhead"):
+        r"""
+        Compile the encoder and decoder with `torch.compile`.
+
+        With the default "reduce-overhead" mode the calls are captured as CUDA graphs, which removes most of the
+        kernel launch overhead when the same tile size is encoded / decoded repeatedly. Shapes are specialized, so
+        this works best together with hw tiling: a tile grid has at most 4 tile shapes (full, last column, last row
+        and corner tiles), which stay within dynamo's default recompile limit of 8. z tiling and tile batching
+        multiply the number of shapes, and the shapes past that limit run eagerly.
+        """
+        self.encoder.compile(mode=mode, dynamic=False)
+        self.decoder.compile(mode=mode, dynamic=False)
+        # the hw tiles stitching is compiled as a whole so that blending, cropping and the copies are fused
+        self._compiled_stitch_tiles = torch.compile(_stitch_tiles, dynamic=False)
+        self.compile_mode = mode
+
+    @torch.no_grad()
+    def fuse_quant_convs(self):
+        r"""
+        Fold the 1x1 `quant_conv` into the last conv of the encoder and `post_quant_conv` into the first conv of the
+        decoder, and replace both with `nn.Identity`. This saves a pass over the latents on every encode / decode.
+
+        Meant for inference only: the quant convs weights are no longer part of the state dict afterwards.
+        `post_quant_conv` is only folded if the decoder input conv does not pad with zeros, as zero padding would
+        not see the folded bias.
+        """
+        if isinstance(self.quant_conv, (nn.Conv2d, nn.Conv3d)):
+            conv = getattr(self.encoder.conv_out, "conv", self.encoder.conv_out)
+            if isinstance(conv, (nn.Conv2d, nn.Conv3d)) and conv.groups == 1:
+                q_weight = self.quant_conv.weight.flatten(1).float()
+                q_bias = self.quant_conv.bias.float()
+                weight = torch.einsum("oc,c...->o...", q_weight, conv.weight.float())
+                bias = q_bias if conv.bias is None else q_weight @ conv.bias.float() + q_bias
+                conv.weight.copy_(weight)
+                if conv.bias is None:
+                    conv.bias = nn.Parameter(bias.to(conv.weight.dtype))
+                else:
+                    conv.bias.copy_(bias)
+                self.quant_conv = nn.Identity()
+
+        if isinstance(self.post_quant_conv, (nn.Conv2d, nn.Conv3d)):
+            conv = getattr(self.decoder.conv_in, "conv", self.decoder.conv_in)
+            if (
+                isinstance(conv, (nn.Conv2d, nn.Conv3d))
+                and conv.groups == 1
+                and (conv.padding_mode != "zeros" or not any(conv.padding))
+            ):
+                p_weight = self.post_quant_conv.weight.flatten(1).float()
+                p_bias = self.post_quant_conv.bias.float()
+                weight = torch.einsum("ok...,kc->oc...", conv.weight.float(), p_weight)
+                bias = torch.einsum("ok...,k->o", conv.weight.float(), p_bias)
+                if conv.bias is not None:
+                    bias += conv.bias.float()
+                conv.weight.copy_(weight)
+                if conv.bias is None:
+                    conv.bias = nn.Parameter(bias.to(conv.weight.dtype))
+                else:
+                    conv.bias.copy_(bias)
+                self.post_quant_conv = nn.Identity()
+
+    def _run(self, module: nn.Module, *args, **kwargs) -> torch.Tensor:
+        if self.use_checkpoint and self.training and torch.is_grad_enabled():
+            # activations are recomputed from the inputs during backward, so the inputs must not be modified afterwards,
+            # which is why _run_tiles does not stage hw tiles in its reused buffers when grad is enabled
+            return torch.utils.checkpoint.checkpoint(module, *args, use_reentrant=False, **kwargs)
+        if self.compile_mode != "reduce-overhead":
+            return module(*args, **kwargs)
+        # cuda graph outputs are overwritten by the next replay, tiles are kept around so copy them out
+        torch.compiler.cudagraph_mark_step_begin()
+        return module(*args, **kwargs).clone()
+
     def _hw_tiled_encode(self, x: torch.FloatTensor, return_dict: bool = True):
         overlap_size = int(self.tile_sample_min_size * (1 - self.tile_overlap_factor))
         blend_extent = int(self.tile_latent_min_size * self.tile_overlap_factor)
@@ -175,55 +336,85 @@ class AutoencoderKLWrapper(ModelMixin, ConfigMixin):
                     i : i + self.tile_sample_min_size,
                     j : j + self.tile_sample_min_size,
                 ]
-                tile = self.encoder(tile)
-                tile = self.quant_conv(tile)
                 row.append(tile)
             rows.append(row)
-        result_rows = []
-        for i, row in enumerate(rows):
-            result_row = []
-            for j, tile in enumerate(row):
-                # blend the above tile and the left tile
-                # to the current tile and add the current tile to the result row
-                if i > 0:
-                    tile = self.blend_v(rows[i - 1][j], tile, blend_extent)
-                if j > 0:
-                    tile = self.blend_h(row[j - 1], tile, blend_extent)
-                result_row.append(tile[:, :, :, :row_limit, :row_limit])
-            result_rows.append(torch.cat(result_row, dim=4))
-
-        moments = torch.cat(result_rows, dim=3)
+        rows = self._run_tiles(
+            lambda tile: self.quant_conv(self._run(self.encoder, tile)), rows
+        )
+        moments = self._stitch_hw_tiles(rows, blend_extent, row_limit)
         return moments
 
+    def _run_tiles(self, fn, rows, timestep: Optional[torch.Tensor] = None):
+        # run fn over a grid of tiles, stacking up to hw_tile_batch consecutive tiles of the same shape per call
+        # without grad, tiles are copied into one contiguous staging buffer per tile shape, so that every call gets a
+        # stable input block instead of materializing a new copy of each tile slice. with grad the buffer could be saved
+        # for backward (or recomputed by checkpointing) after being overwritten, so the tiles are passed directly
+        tiles = [tile for row in rows for tile in row]
+        kwargs = {} if timestep is None else {"timestep": timestep}
+        staging = None if torch.is_grad_enabled() else {}
+        outputs = []
+        i = 0
+        while i < len(tiles):
+            n = 1
+            while n < self.hw_tile_batch and i + n < len(tiles) and tiles[i + n].shape == tiles[i].shape:
+                n += 1
+            if staging is None:
+                tile_in = tiles[i] if n == 1 else torch.cat(tiles[i : i + n])
+            else:
+                shape = (n * tiles[i].shape[0], *tiles[i].shape[1:])
+                tile_in = staging.get(shape)
+                if tile_in is None:
+                    tile_in = staging[shape] = tiles[i].new_empty(shape)
+                if n == 1:
+                    tile_in.copy_(tiles[i])
+                else:
+                    torch.cat(tiles[i : i + n], out=tile_in)
+            if n == 1:
+                outputs.append(fn(tile_in, **kwargs))
+            else:
+                b = tiles[i].shape[0]
+                batch_kwargs = kwargs if timestep is None else {"timestep": self._repeat_timestep(timestep, n, b)}
+                # plain slices rather than chunk(), whose views can't be blended in place under grad
+                out = fn(tile_in, **batch_kwargs)
+                outputs += [out[k * b : (k + 1) * b] for k in range(n)]
+            i += n
+        out_rows = []
+        for row in rows:
+            out_rows.append(outputs[: len(row)])
+            outputs = outputs[len(row) :]
+        return out_rows
+
+    @staticmethod
+    def _repeat_timestep(timestep: torch.Tensor, n: int, batch_size: int) -> torch.Tensor:
+        # match a timestep to n tiles of batch_size samples stacked along the batch dimension
+        if timestep.dim() == 0:
+            return timestep.reshape(1).repeat(n * batch_size)
+        return timestep.repeat(n, *[1] * (timestep.dim() - 1))
+
+    def _stitch_hw_tiles(self, rows, blend_extent: int, row_limit: int) -> torch.Tensor:
+        stitch = self._compiled_stitch_tiles if self.compile_mode is not None else _stitch_tiles
+        return stitch(rows, blend_extent, row_limit)
+
     def blend_z(
         self, a: torch.Tensor, b: torch.Tensor, blend_extent: int
     ) -> torch.Tensor:
-        blend_extent = min(a.shape[2], b.shape[2], blend_extent)
-        for z in range(blend_extent):
-            b[:, :, z, :, :] = a[:, :, -blend_extent + z, :, :] * (
-                1 - z / blend_extent
-            ) + b[:, :, z, :, :] * (z / blend_extent)
-        return b
+        return _blend_fn(_blend_z)(a, b, blend_extent)
 
     def blend_v(
         self, a: torch.Tensor, b: torch.Tensor, blend_extent: int
     ) -> torch.Tensor:
-        blend_extent = min(a.shape[3], b.shape[3], blend_extent)
-        for y in range(blend_extent):
-            b[:, :, :, y, :] = a[:, :, :, -blend_extent + y, :] * (
-                1 - y / blend_extent
-            ) + b[:, :, :, y, :] * (y / blend_extent)
-        return b
+        return _blend_fn(_blend_v)(a, b, blend_extent)
 
     def blend_h(
         self, a: torch.Tensor, b: torch.Tensor, blend_extent: int
     ) -> torch.Tensor:
-        blend_extent = min(a.shape[4], b.shape[4], blend_extent)
-        for x in range(blend_extent):
-            b[:, :, :, :, x] = a[:, :, :, :, -blend_extent + x] * (
-                1 - x / blend_extent
-            ) + b[:, :, :, :, x] * (x / blend_extent)
-        return b
+        return _blend_fn(_blend_h)(a, b, blend_extent)
+
+    @staticmethod
+    def _unstage(dec: torch.Tensor, copied: torch.cuda.Event, buf: torch.Tensor, t_off: int):
+        # move a tile out of its pinned staging buffer into the output once its device to host copy is done
+        copied.synchronize()
+        dec[:, :, t_off : t_off + buf.shape[2]].copy_(buf)
 
     def _hw_tiled_decode(self, z: torch.FloatTensor, target_shape, timestep = None):
         overlap_size = int(self.tile_latent_min_size * (1 - self.tile_overlap_factor))
@@ -247,24 +438,16 @@ class AutoencoderKLWrapper(ModelMixin, ConfigMixin):
                     i : i + self.tile_latent_min_size,
                     j : j + self.tile_latent_min_size,
                 ]
-                tile = self.post_quant_conv(tile)
-                decoded = self.decoder(tile, target_shape=tile_target_shape, timestep = timestep)
-                row.append(decoded)
+                row.append(tile)
             rows.append(row)
-        result_rows = []
-        for i, row in enumerate(rows):
-            result_row = []
-            for j, tile in enumerate(row):
-                # blend the above tile and the left tile
-                # to the current tile and add the current tile to the result row
-                if i > 0:
-                    tile = self.blend_v(rows[i - 1][j], tile, blend_extent)
-                if j > 0:
-                    tile = self.blend_h(row[j - 1], tile, blend_extent)
-                result_row.append(tile[:, :, :, :row_limit, :row_limit])
-            result_rows.append(torch.cat(result_row, dim=4))
-
-        dec = torch.cat(result_rows, dim=3)
+        rows = self._run_tiles(
+            lambda tile, timestep=None: self._run(
+                self.decoder, self.post_quant_conv(tile), target_shape=tile_target_shape, timestep=timestep
+            ),
+            rows,
+            timestep=timestep,
+        )
+        dec = self._stitch_hw_tiles(rows, blend_extent, row_limit)
         return dec
 
     def encode(
@@ -280,7 +463,11 @@ class AutoencoderKLWrapper(ModelMixin, ConfigMixin):
             blend_extent = int(tile_latent_min_tsize * tile_overlap_factor)
             t_limit = tile_latent_min_tsize - blend_extent
 
-            row = []
+            # each tile is blended with the overlap of the previous one and its kept frames are copied into a
+            # preallocated output, sized exactly for the 1 + (T - 1) // 8 latent frames they add up to
+            moments = None
+            t_off = 0
+            prev_tail = None
             for i in range(0, T, overlap_size):
                 tile = z[:, :, i: i + tile_sample_min_tsize + 1, :, :]
                 if self.use_hw_tiling:
@@ -289,16 +476,14 @@ class AutoencoderKLWrapper(ModelMixin, ConfigMixin):
                     tile = self._encode(tile)
                 if i > 0:
                     tile = tile[:, :, 1:, :, :]
-                row.append(tile)
-            result_row = []
-            for i, tile in enumerate(row):
-                if i > 0:
-                    tile = self.blend_z(row[i - 1], tile, blend_extent)
-                    result_row.append(tile[:, :, :t_limit, :, :])
-                else:
-                    result_row.append(tile[:, :, :t_limit + 1, :, :])
-
-            moments = torch.cat(result_row, dim=2)
+                    tile = self.blend_z(prev_tail, tile, blend_extent)
+                kept = tile[:, :, : t_limit + 1 if i == 0 else t_limit]
+                if moments is None:
+                    moments = tile.new_empty((*tile.shape[:2], 1 + (T - 1) // 8, *tile.shape[3:]))
+                moments[:, :, t_off : t_off + kept.shape[2]].copy_(kept)
+                t_off += kept.shape[2]
+                prev_tail = tile[:, :, max(tile.shape[2] - blend_extent, 0) :].clone()
+                tile = kept = None
 
 
         else:
@@ -315,32 +500,47 @@ class AutoencoderKLWrapper(ModelMixin, ConfigMixin):
         return AutoencoderKLOutput(latent_dist=posterior)
 
     def _normalize_latent_channels(self, z: torch.FloatTensor) -> torch.FloatTensor:
-        if isinstance(self.latent_norm_out, nn.BatchNorm3d):
-            _, c, _, _, _ = z.shape
-            z = torch.cat(
+        if self._latent_norm_kind == "bn3d":
+            return self._norm_bn3d(z)
+        if self._latent_norm_kind == "bn2d":
+            raise NotImplementedError("BatchNorm2d not supported")
+        return z
+
+    def _unnormalize_latent_channels(self, z: torch.FloatTensor) -> torch.FloatTensor:
+        if self._latent_norm_kind == "bn3d":
+            return self._unnorm_bn3d(z)
+        if self._latent_norm_kind == "bn2d":
+            raise NotImplementedError("BatchNorm2d not supported")
+        return z
+
+    def _norm_bn3d(self, z: torch.FloatTensor) -> torch.FloatTensor:
+        _, c, _, _, _ = z.shape
+        if self.latent_norm_out.training or torch.is_grad_enabled():
+            return torch.cat(
                 [
                     self.latent_norm_out(z[:, : c // 2, :, :, :]),
                     z[:, c // 2 :, :, :, :],
                 ],
                 dim=1,
             )
-        elif isinstance(self.latent_norm_out, nn.BatchNorm2d):
-            raise NotImplementedError("BatchNorm2d not supported")
+        # inference: normalize the means in place with the running statistics instead of rebuilding z
+        running_mean = self.latent_norm_out.running_mean.view(1, -1, 1, 1, 1)
+        running_var = self.latent_norm_out.running_var.view(1, -1, 1, 1, 1)
+        eps = self.latent_norm_out.eps
+
+        z[:, : c // 2].sub_(running_mean).mul_(torch.rsqrt(running_var + eps))
         return z
 
-    def _unnormalize_latent_channels(self, z: torch.FloatTensor) -> torch.FloatTensor:
-        if isinstance(self.latent_norm_out, nn.BatchNorm3d):
-            running_mean = self.latent_norm_out.running_mean.view(1, -1, 1, 1, 1)
-            running_var = self.latent_norm_out.running_var.view(1, -1, 1, 1, 1)
-            eps = self.latent_norm_out.eps
+    def _unnorm_bn3d(self, z: torch.FloatTensor) -> torch.FloatTensor:
+        running_mean = self.latent_norm_out.running_mean.view(1, -1, 1, 1, 1)
+        running_var = self.latent_norm_out.running_var.view(1, -1, 1, 1, 1)
+        eps = self.latent_norm_out.eps
 
-            z = z * torch.sqrt(running_var + eps) + running_mean
-        elif isinstance(self.latent_norm_out, nn.BatchNorm3d):
-            raise NotImplementedError("BatchNorm2d not supported")
-        return z
+        # scale and shift in a single pass over z, only the per channel scale is computed separately
+        return torch.addcmul(running_mean, z, torch.sqrt(running_var + eps))
 
     def _encode(self, x: torch.FloatTensor) -> AutoencoderKLOutput:
-        h = self.encoder(x)
+        h = self._run(self.encoder, x)
         moments = self.quant_conv(h)
         moments = self._normalize_latent_channels(moments)
         return moments
@@ -353,10 +553,10 @@ class AutoencoderKLWrapper(ModelMixin, ConfigMixin):
     ) -> Union[DecoderOutput, torch.FloatTensor]:
         z = self._unnormalize_latent_channels(z)
         z = self.post_quant_conv(z)
-        if "timestep" in self.decoder_params:
-            dec = self.decoder(z, target_shape=target_shape, timestep=timestep)
+        if self._decoder_takes_timestep:
+            dec = self._run(self.decoder, z, target_shape=target_shape, timestep=timestep)
         else:
-            dec = self.decoder(z, target_shape=target_shape)
+            dec = self._run(self.decoder, z, target_shape=target_shape)
         return dec
 
     def decode(
@@ -378,29 +578,71 @@ class AutoencoderKLWrapper(ModelMixin, ConfigMixin):
             blend_extent = int(tile_sample_min_tsize * tile_overlap_factor)
             t_limit = tile_sample_min_tsize - blend_extent
 
-            row = []
-            for i in range(0, T, overlap_size):
-                tile = z[:, :, i: i + tile_latent_min_tsize + 1, :, :]
-                target_shape_split = list(target_shape)
-                target_shape_split[2] = tile.shape[2] * 8                
-                if self.use_hw_tiling:
-                    decoded = self._hw_tiled_decode(tile, target_shape, timestep)
-                else:
-                    decoded = self._decode(tile, target_shape=target_shape, timestep=timestep)
-
+            # tiles are blended on the device as they come and their kept frames are written into a preallocated
+            # contiguous cpu output, sized exactly for the 1 + 8 * (T - 1) frames they add up to.
+            # On cuda the kept frames go through one of two tile sized pinned staging buffers, copied on a side stream
+            # so that the transfer overlaps the decoding of the next tile, and are moved into the output one tile later.
+            copy_stream = torch.cuda.Stream(z.device) if z.is_cuda else None
+            staging = [None, None]
+            staged = None
+            num_tiles = len(range(0, T, overlap_size))
+            dec = None
+            t_off = 0
+            prev_tail = None
+            tiles = [z[:, :, i: i + tile_latent_min_tsize + 1, :, :] for i in range(0, T, overlap_size)]
+            decoded_batch = []
+            for i in range(num_tiles):
+                if not decoded_batch:
+                    # decode up to z_tile_batch consecutive tiles of the same shape in a single call
+                    n = 1
+                    while n < self.z_tile_batch and i + n < num_tiles and tiles[i + n].shape == tiles[i].shape:
+                        n += 1
+                    tile = torch.cat(tiles[i : i + n]) if n > 1 else tiles[i]
+                    tile_timestep = timestep if timestep is None or n == 1 else self._repeat_timestep(timestep, n, B)
+                    if self.use_hw_tiling:
+                        decoded_batch = self._hw_tiled_decode(tile, target_shape, tile_timestep)
+                    else:
+                        decoded_batch = self._decode(tile, target_shape=target_shape, timestep=tile_timestep)
+                    # plain slices, like _run_tiles, so that the tiles can be blended in place under grad
+                    decoded_batch = [decoded_batch[k * B : (k + 1) * B] for k in range(n)]
+                    tile = None
+                decoded = decoded_batch.pop(0)
+
+                # cast on the device first, blending and the transfer then move half the bytes of float32 output
+                decoded = decoded.to(torch.float16)
                 if i > 0:
                     decoded = decoded[:, :, 1:, :, :]
-                row.append(decoded.to(torch.float16).cpu())
-                decoded = None
-            result_row = []
-            for i, tile in enumerate(row):
-                if i > 0:
-                    tile = self.blend_z(row[i - 1], tile, blend_extent)
-                    result_row.append(tile[:, :, :t_limit, :, :])
+                    decoded = self.blend_z(prev_tail, decoded, blend_extent)
+                kept = decoded[:, :, : t_limit + 1 if i == 0 else t_limit]
+                if dec is None:
+                    dec = torch.empty(
+                        (*kept.shape[:2], 1 + 8 * (T - 1), *kept.shape[3:]), dtype=torch.float16, device="cpu"
+                    )
+                if copy_stream is None:
+                    dec[:, :, t_off : t_off + kept.shape[2]].copy_(kept)
                 else:
-                    result_row.append(tile[:, :, :t_limit + 1, :, :])
-
-            dec = torch.cat(result_row, dim=2)
+                    kept = kept.contiguous()
+                    slot = i % 2
+                    if staging[slot] is None or staging[slot].numel() < kept.numel():
+                        staging[slot] = torch.empty(kept.numel(), dtype=torch.float16, pin_memory=True)
+                    buf = staging[slot][: kept.numel()].view(kept.shape)
+                    copy_stream.wait_stream(torch.cuda.current_stream(z.device))
+                    with torch.cuda.stream(copy_stream):
+                        buf.copy_(kept, non_blocking=True)
+                        copied = copy_stream.record_event()
+                    kept.record_stream(copy_stream)
+                    if staged is not None:
+                        self._unstage(dec, *staged)
+                    staged = (copied, buf, t_off)
+                t_off += kept.shape[2]
+                prev_tail = decoded[:, :, max(decoded.shape[2] - blend_extent, 0) :].clone()
+                decoded = kept = None
+            if staged is not None:
+                self._unstage(dec, *staged)
+                staged = buf = staging = None
+                # hand the pinned staging memory back rather than leaving it in torch's pinned memory cache
+                if hasattr(torch._C, "_host_emptyCache"):
+                    torch._C._host_emptyCache()
             if not return_dict:
                 return (dec,)
 